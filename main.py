@@ -5,9 +5,11 @@ import yt_dlp
 import whisper
 import warnings
 import threading
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox
 import re
+import glob
 import queue
 import requests
 import json
@@ -17,17 +19,136 @@ import concurrent.futures
 # 忽略所有警告
 warnings.filterwarnings("ignore")
 
-# 清理输出目录
-def clear_output_directory(output_dir, max_files=10):
-    if os.path.exists(output_dir):
-        files = os.listdir(output_dir)
-        if len(files) > max_files:
-            for file in files:
-                file_path = os.path.join(output_dir, file)
-                if os.path.isfile(file_path):
+# 音频缓存配置：磁盘预算（字节）和音频保留时长（秒），可通过环境变量覆盖
+# 读取正整数环境变量，格式错误或不大于0时使用默认值
+def read_positive_int_env(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        parsed = int(value)
+    except ValueError:
+        print(f"环境变量 {name} 不是有效整数: {value}，使用默认值 {default}")
+        return default
+    if parsed <= 0:
+        print(f"环境变量 {name} 必须大于0: {value}，使用默认值 {default}")
+        return default
+    return parsed
+
+# 可选的Whisper模型，默认使用tiny
+WHISPER_MODELS = ["tiny", "base", "small", "medium", "large"]
+DEFAULT_WHISPER_MODEL = "tiny"
+
+AUDIO_CACHE_DIRNAME = ".audio_cache"
+AUDIO_CACHE_MAX_BYTES = read_positive_int_env("AUDIO_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024)
+AUDIO_CACHE_RETENTION_SECONDS = read_positive_int_env("AUDIO_CACHE_RETENTION_SECONDS", 24 * 60 * 60)
+
+# 音频缓存：中间音频与最终转录文本分开存放，只对音频做磁盘预算和LRU淘汰
+class AudioCache:
+    def __init__(self, output_dir, max_bytes=AUDIO_CACHE_MAX_BYTES, retention_seconds=AUDIO_CACHE_RETENTION_SECONDS):
+        self.output_dir = output_dir
+        self.cache_dir = os.path.join(output_dir, AUDIO_CACHE_DIRNAME)
+        self.max_bytes = max_bytes
+        self.retention_seconds = retention_seconds
+        self.lock = threading.Lock()
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        # 将旧版本留在output根目录下的mp3移入缓存目录，纳入预算管理
+        for file in os.listdir(output_dir):
+            file_path = os.path.join(output_dir, file)
+            if file.endswith(".mp3") and os.path.isfile(file_path):
+                try:
+                    shutil.move(file_path, os.path.join(self.cache_dir, file))
+                except OSError as e:
+                    print(f"移动旧音频到缓存目录失败: {file_path}: {e}")
+
+        # 清理上次被中断（如关闭窗口）的下载留下的临时文件
+        self.discard_partial()
+
+    # 缓存中音频文件的路径，按视频来源和ID命名，避免同名视频互相覆盖
+    def audio_path(self, cache_key):
+        return os.path.join(self.cache_dir, f"{cache_key}.mp3")
+
+    # 下载过程中使用的临时文件名前缀，转换完成后才改名为正式缓存文件
+    def partial_prefix(self, cache_key):
+        return os.path.join(self.cache_dir, f"{cache_key}.tmp")
+
+    # 下载和转换成功后，将临时mp3改名为正式缓存文件
+    def commit(self, cache_key):
+        path = self.audio_path(cache_key)
+        with self.lock:
+            os.replace(f"{self.partial_prefix(cache_key)}.mp3", path)
+            os.utime(path)
+        return path
+
+    # 删除指定缓存键的临时文件（.part/.webm/.m4a/未完成的.mp3等），不指定时删除全部
+    def discard_partial(self, cache_key=None):
+        if cache_key is None:
+            pattern = os.path.join(glob.escape(self.cache_dir), "*.tmp.*")
+        else:
+            pattern = glob.escape(self.partial_prefix(cache_key)) + ".*"
+        with self.lock:
+            for file_path in glob.glob(pattern):
+                try:
+                    os.remove(file_path)
+                except OSError as e:
+                    print(f"删除临时音频失败: {file_path}: {e}")
+
+    # 查找已缓存的音频，命中时刷新其最近使用时间
+    def lookup(self, cache_key):
+        path = self.audio_path(cache_key)
+        with self.lock:
+            if not os.path.isfile(path):
+                return None
+            os.utime(path)
+            return path
+
+    # 标记音频刚被使用（下载或转录完成后调用）
+    def touch(self, path):
+        with self.lock:
+            if os.path.isfile(path):
+                os.utime(path)
+
+    # 执行淘汰：先删除超过保留时长的音频，再按最近使用时间淘汰直到满足磁盘预算
+    # keep 中的路径（正在使用的音频）不会被删除
+    def enforce(self, keep=()):
+        keep = {os.path.abspath(path) for path in keep}
+        removed = []
+        with self.lock:
+            entries = []
+            for file in os.listdir(self.cache_dir):
+                file_path = os.path.abspath(os.path.join(self.cache_dir, file))
+                # 文件可能在listdir之后被删除
+                try:
+                    if not os.path.isfile(file_path):
+                        continue
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file_path))
+
+            # 最久未使用的排在前面
+            entries.sort()
+            total_bytes = sum(size for _, size, _ in entries)
+            now = time.time()
+
+            for last_used, size, file_path in entries:
+                if file_path in keep:
+                    continue
+                expired = now - last_used > self.retention_seconds
+                if not expired and total_bytes <= self.max_bytes:
+                    continue
+                try:
                     os.remove(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
+                except OSError as e:
+                    print(f"删除缓存音频失败: {file_path}: {e}")
+                    continue
+                total_bytes -= size
+                removed.append(file_path)
+
+        return removed
 
 # 文件名清理函数，去除非法字符
 def sanitize_filename(filename):
@@ -64,23 +185,24 @@ def download_video(url, output_dir):
     
     return video_output_path, None
 
-# 提取音频并转换为mp3
-def extract_audio(url, output_dir):
+# 提取音频并转换为mp3，已缓存的音频直接复用
+def extract_audio(url, audio_cache):
     audio_output_path = ''
-    
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
 
-    # 先下载视频的元信息以获取标题
+    # 先下载视频的元信息，以视频来源和ID作为缓存键
     with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
         info = ydl.extract_info(url, download=False)
-        original_title = info['title']
-        clean_title = sanitize_filename(original_title)  # 清理文件名中的非法字符
+        cache_key = sanitize_filename(f"{info['extractor_key']}_{info['id']}")
+
+    # 缓存命中时跳过下载
+    cached_path = audio_cache.lookup(cache_key)
+    if cached_path:
+        return cached_path
 
     ydl_opts = {
         'format': 'bestaudio/best',
-        # 直接在下载时使用清理后的标题
-        'outtmpl': os.path.join(output_dir, f"{clean_title}.%(ext)s"),
+        # 先下载到临时文件名，避免中途失败留下的不完整mp3被当作缓存命中
+        'outtmpl': audio_cache.partial_prefix(cache_key) + ".%(ext)s",
         'postprocessors': [
             {
                 'key': 'FFmpegExtractAudio',
@@ -93,11 +215,14 @@ def extract_audio(url, output_dir):
         'logger': None
     }
     
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        result = ydl.download([url])
-        if result == 0:
-            audio_output_path = os.path.join(output_dir, f"{clean_title}.mp3")
-            return audio_output_path
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            result = ydl.download([url])
+        if result == 0 and os.path.isfile(audio_cache.partial_prefix(cache_key) + ".mp3"):
+            audio_output_path = audio_cache.commit(cache_key)
+    finally:
+        # 下载或转换失败时清理该视频留下的临时文件
+        audio_cache.discard_partial(cache_key)
     
     return audio_output_path
 
@@ -144,6 +269,21 @@ class TranscriptionApp:
         self.url_entry = tk.Text(self.root, width=50, height=10)
         self.url_entry.pack(pady=10)
 
+        # 模型选择和重新转录选项，重新转录时复用缓存中的音频
+        self.options_frame = tk.Frame(self.root)
+        self.options_frame.pack(pady=5)
+
+        self.model_label = tk.Label(self.options_frame, text="模型:")
+        self.model_label.pack(side=tk.LEFT)
+
+        self.model_var = tk.StringVar(value=DEFAULT_WHISPER_MODEL)
+        self.model_combobox = ttk.Combobox(self.options_frame, textvariable=self.model_var, values=WHISPER_MODELS, state="readonly", width=10)
+        self.model_combobox.pack(side=tk.LEFT, padx=5)
+
+        self.retranscribe_var = tk.BooleanVar(value=False)
+        self.retranscribe_check = ttk.Checkbutton(self.options_frame, text="重新转录已完成的视频", variable=self.retranscribe_var)
+        self.retranscribe_check.pack(side=tk.LEFT, padx=5)
+
         # 下载和转录按钮
         self.transcribe_button = ttk.Button(self.root, text="开始转录", command=self.start_transcription)
         self.transcribe_button.pack(pady=10)
@@ -164,12 +304,16 @@ class TranscriptionApp:
 
         # 任务队列
         self.task_queue = queue.Queue()
-        self.model = whisper.load_model("tiny")
+        self.models = {DEFAULT_WHISPER_MODEL: whisper.load_model(DEFAULT_WHISPER_MODEL)}  # 已加载的模型
         self.processing = False
         self.task_items = {}  # 用来跟踪任务索引
         self.completed_tasks = set()  # 保存已经完成的任务的标题
         self.selected_task = None
 
+        # 音频缓存，启动时清理过期音频
+        self.audio_cache = AudioCache(os.path.abspath('output'))
+        self.audio_cache.enforce()
+
         # 按钮
         self.summary_button = None
         self.analyzed_button = None
@@ -181,8 +325,16 @@ class TranscriptionApp:
         # 在启动时加载已完成的任务
         self.load_completed_tasks()
 
+    # 获取模型，未加载过的模型在首次使用时加载
+    def get_model(self, model_name):
+        if model_name not in self.models:
+            self.status_label.config(text=f"状态: 正在加载模型 {model_name}")
+            self.status_label.update()
+            self.models[model_name] = whisper.load_model(model_name)
+        return self.models[model_name]
+
     # 下载并转录视频的函数
-    def transcribe_video(self, title, url):
+    def transcribe_video(self, title, url, model_name=DEFAULT_WHISPER_MODEL):
         output_dir = os.path.abspath('output')
         
         # 更新任务状态为"下载中"
@@ -191,40 +343,48 @@ class TranscriptionApp:
         self.task_listbox.insert(task_index, f"{task_index + 1}  [{title}]  [下载中...]")
         self.task_listbox.update()
 
-        # 下载视频并提取音频，返回清理后的音频路径
-        audio_output_path = extract_audio(url, output_dir)
+        audio_output_path = ''
+        try:
+            # 下载视频并提取音频，返回清理后的音频路径
+            audio_output_path = extract_audio(url, self.audio_cache)
 
-        if not audio_output_path:
-            messagebox.showerror("下载错误", f"无法下载视频或提取音频: {title}")
-            return
+            if not audio_output_path:
+                messagebox.showerror("下载错误", f"无法下载视频或提取音频: {title}")
+                return
 
-        # 更新任务状态为"转录中"
-        self.task_listbox.delete(task_index)
-        self.task_listbox.insert(task_index, f"{task_index + 1}  [{title}]  [转录中...]")
-        self.task_listbox.update()
+            # 更新任务状态为"转录中"
+            self.task_listbox.delete(task_index)
+            self.task_listbox.insert(task_index, f"{task_index + 1}  [{title}]  [转录中...]")
+            self.task_listbox.update()
 
-        # 开始转录音频，使用清理后的音频路径
-        def update_progress(current_segment, total_segments):
-            progress_percent = (current_segment / total_segments) * 100
-            self.status_label.config(text=f"正在转录: {progress_percent:.2f}% 完成")
-            self.status_label.update()
+            # 开始转录音频，使用清理后的音频路径
+            def update_progress(current_segment, total_segments):
+                progress_percent = (current_segment / total_segments) * 100
+                self.status_label.config(text=f"正在转录: {progress_percent:.2f}% 完成")
+                self.status_label.update()
 
-        transcription = self.transcribe_audio(audio_output_path, self.model, update_progress)
+            transcription = self.transcribe_audio(audio_output_path, self.get_model(model_name), update_progress)
 
-        # 保存转录文本
-        transcript_file = os.path.join(output_dir, sanitize_filename(title), f"{sanitize_filename(title)}.txt")
-        if not os.path.exists(os.path.dirname(transcript_file)):
-            os.makedirs(os.path.dirname(transcript_file))
+            # 保存转录文本
+            transcript_file = os.path.join(output_dir, sanitize_filename(title), f"{sanitize_filename(title)}.txt")
+            if not os.path.exists(os.path.dirname(transcript_file)):
+                os.makedirs(os.path.dirname(transcript_file))
 
-        with open(transcript_file, "w", encoding="utf-8") as f:
-            f.write(transcription)
+            with open(transcript_file, "w", encoding="utf-8") as f:
+                f.write(transcription)
 
-        # 更新任务状态为"已完成"
-        self.task_listbox.delete(task_index)
-        self.task_listbox.insert(task_index, f"{task_index + 1}  [{title}]  [已完成]")
-        self.task_listbox.update()
+            # 刷新刚转录音频的最近使用时间，以便短期内重新处理
+            self.audio_cache.touch(audio_output_path)
 
-        self.completed_tasks.add(title)
+            # 更新任务状态为"已完成"
+            self.task_listbox.delete(task_index)
+            self.task_listbox.insert(task_index, f"{task_index + 1}  [{title}]  [已完成]")
+            self.task_listbox.update()
+
+            self.completed_tasks.add(title)
+        finally:
+            # 无论下载或转录是否成功都按磁盘预算淘汰音频，当前音频除外
+            self.audio_cache.enforce(keep=[audio_output_path] if audio_output_path else [])
 
 
     # 音频转录函数，带分段处理并保存时间轴，并提供更加精确的进度更新
@@ -255,8 +415,8 @@ class TranscriptionApp:
     def process_tasks(self):
         self.processing = True
         while not self.task_queue.empty():
-            title, url = self.task_queue.get()
-            self.transcribe_video(title, url)  # Now calling the correct method
+            title, url, model_name = self.task_queue.get()
+            self.transcribe_video(title, url, model_name)
         self.processing = False
 
 
@@ -608,30 +768,47 @@ class TranscriptionApp:
         # 清除输入框内容
         self.url_entry.delete("1.0", tk.END)
 
+        model_name = self.model_var.get()
+        retranscribe = self.retranscribe_var.get()
+
         # 将任务添加到任务队列和列表框
         for title, url in urls_with_titles:
-            # 如果任务已经存在于completed_tasks，跳过它
-            if title in self.completed_tasks:
+            # 如果任务已经存在于completed_tasks，除非选择了重新转录，否则跳过它
+            if title in self.completed_tasks and not retranscribe:
                 continue
 
-            task_index = self.task_listbox.size() + 1
-            self.task_listbox.insert(tk.END, f"{task_index}  [{title}]  [等待中...]")
+            # 重新转录时复用已有的列表项，否则添加新的列表项
+            task_index = self.find_task_index(title) if title in self.completed_tasks else None
+            if task_index is None:
+                task_index = self.task_listbox.size()
+                self.task_listbox.insert(tk.END, f"{task_index + 1}  [{title}]  [等待中...]")
+            else:
+                self.task_listbox.delete(task_index)
+                self.task_listbox.insert(task_index, f"{task_index + 1}  [{title}]  [等待中...]")
             self.task_listbox.update()
 
             # 将任务添加到队列
-            self.task_queue.put((title, url))
-            self.task_items[url] = task_index - 1  # 用于更新状态的索引
+            self.task_queue.put((title, url, model_name))
+            self.task_items[url] = task_index  # 用于更新状态的索引
 
         # 如果没有任务在处理，启动处理线程
         if not self.processing:
             threading.Thread(target=self.process_tasks, daemon=True).start()
 
+    # 查找标题对应的列表项索引，不存在时返回None
+    def find_task_index(self, title):
+        for i in range(self.task_listbox.size()):
+            task_text = self.task_listbox.get(i)
+            if f"[{title}]" in task_text or f"[{sanitize_filename(title)}]" in task_text:
+                return i
+        return None
+
     # 处理任务队列
     def process_tasks(self):
         self.processing = True
         while not self.task_queue.empty():
-            title, url = self.task_queue.get()
-            self.transcribe_video(title, url)
+            title, url, model_name = self.task_queue.get()
+            self.transcribe_video(title, url, model_name)
         self.processing = False
 
 # 提取URL和标题的函数